@@ -1,4 +1,4 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 
 #
 # CappedDownloadQueue for NZBGet
@@ -27,7 +27,7 @@
 ##############################################################################
 ### TASK TIME: *                                                           ###
 ### NZBGET QUEUE/SCHEDULER SCRIPT                                          ###
-### QUEUE EVENTS: NZB_ADDED                                                ###
+### QUEUE EVENTS: NZB_ADDED, NZB_DELETED                                   ###
 
 # Caps the maximum total size of NZBs that are currently being downloaded/processed.
 #
@@ -38,13 +38,14 @@
 # and so on will continue to work as normal. NZBs will be picked in priority order when deciding which
 # NZB to resume next.
 #
-# Queue-Script: Pauses newly-added NZBs.
+# Queue-Script: Pauses newly-added NZBs and wakes the scheduler when NZBs are added or deleted.
 #
 # Scheduler-Script: Resumes NZBs until the sum of the resumed NZBs reaches the configured storage size limit.
 #
 # Script version: 1.0.0
 #
-# NOTE: This script requires Python 2 or 3 installed on your system.
+# NOTE: This script requires Python 3.8 or newer installed on your system. If NumPy (and optionally
+# Numba) is installed it will be used to speed up very large queues.
 
 ##############################################################################
 ### OPTIONS                                                                ###
@@ -56,98 +57,449 @@
 # The number of seconds between checking if any downloads can be resumed (seconds).
 #SchedulerRefreshInterval=15
 
+# The maximum number of seconds between checks while there is nothing to resume (seconds).
+# The interval doubles after every check that resumes nothing, up to this limit, and drops
+# back to SchedulerRefreshInterval once downloads are resumed or a new NZB is added.
+#SchedulerMaxRefreshInterval=60
+
+# The priority a paused NZB gains for every hour it waits to be resumed (0 disables aging).
+# For reference, NZBGet priorities go from -100 (very low) to 100 (very high) in steps of 50.
+# Use this to stop low priority NZBs from waiting forever behind higher priority ones.
+#PriorityAgingRate=0
+
 ### NZBGET QUEUE/SCHEDULER SCRIPT                                          ###
 ##############################################################################
 
-import io
+import bisect
+import collections
+import functools
 import os
+import select
+import stat
 import sys
+import tempfile
 import time
 
-try:
-    # Python 3.x
-    from xmlrpc.client import ServerProxy
-except ImportError:
-    # Python 2.x
-    from xmlrpclib import ServerProxy
+from xmlrpc.client import ExpatParser, ServerProxy, Transport, Unmarshaller
 
 
 PP_SUCCESS=93
 PP_ERROR=94
 
+# Minimum number of paused groups before resume selection is vectorized with NumPy (if installed).
+# Below this, building the arrays costs more than it saves.
+VECTORIZE_MIN_GROUPS=1000
+
+# Queue events that the queue script acts on
+QUEUE_EVENTS=frozenset(['NZB_ADDED', 'NZB_DELETED'])
+
+# The fields of an NZBGet group (listgroups entry) that the scheduler uses
+Group=collections.namedtuple('Group', ['nzbid', 'priority', 'size_mb', 'remaining_size_mb', 'status'])
+
+# The fields that are unmarshalled from the scheduler's listgroups responses, everything else is skipped.
+# faultCode/faultString are kept so errors from NZBGet are still raised as a Fault.
+LISTGROUPS_FIELDS=frozenset(['NZBID', 'MaxPriority', 'FileSizeMB', 'RemainingSizeMB', 'Status', 'faultCode', 'faultString'])
+
+# Shared XML-RPC connection, see nzbget_xml_rpc()
+_nzbget=None
+
+# Optional NumPy and Numba modules, only imported by the scheduler, see scheduler_import_optional_modules()
+numpy=None
+numba=None
 
-def nzbget_connect_xml_rpc():
+
+@functools.lru_cache(maxsize=1)
+def nzbget_xml_rpc_url():
+    """ Returns the XML-RPC URL for NZBGet, building it from the environment on first use. """
     host = os.environ['NZBOP_CONTROLIP']
     port = os.environ['NZBOP_CONTROLPORT']
     username = os.environ['NZBOP_CONTROLUSERNAME']
     password = os.environ['NZBOP_CONTROLPASSWORD']
-    
+
     if host == '0.0.0.0':
         host = '127.0.0.1'
 
-    rpc_url = 'http://%s:%s@%s:%s/xmlrpc' % (username, password, host, port);
+    return f'http://{username}:{password}@{host}:{port}/xmlrpc'
+
+class FieldFilterUnmarshaller(Unmarshaller):
+    """ Unmarshaller that skips struct members whose name isn't in fields without building their values.
+    NZBGet returns dozens of fields (including nested parameter and stat lists) per group, but only a few are used. """
+
+    def __init__(self, fields, **kwargs):
+        super().__init__(**kwargs)
+        self._fields = fields
+        self._skip_next_value = False
+        # Depth of elements inside the member value currently being skipped (0 if not skipping)
+        self._skip_depth = 0
+
+    def start(self, tag, attrs):
+        if self._skip_depth:
+            self._skip_depth += 1
+        elif self._skip_next_value and tag == 'value':
+            self._skip_next_value = False
+            self._skip_depth = 1
+        else:
+            super().start(tag, attrs)
+
+    def data(self, text):
+        if not self._skip_depth:
+            super().data(text)
+
+    def end(self, tag):
+        if self._skip_depth:
+            self._skip_depth -= 1
+            return
+
+        super().end(tag)
+
+        # The member name has just been pushed, drop it along with the value that follows
+        if tag == 'name' and self._stack[-1] not in self._fields:
+            self._stack.pop()
+            self._skip_next_value = True
+
+class FieldFilterTransport(Transport):
+    """ Transport that only unmarshals the struct members named in fields from XML-RPC responses. """
+
+    def __init__(self, fields, **kwargs):
+        super().__init__(**kwargs)
+        self._fields = fields
+
+    def getparser(self):
+        target = FieldFilterUnmarshaller(self._fields, use_builtin_types=self._use_builtin_types)
+        return ExpatParser(target), target
+
+def nzbget_connect_xml_rpc(fields=None):
+    """ Connects to NZBGet's XML-RPC API. If fields is given, struct members not named in it are dropped from
+    every response, so only use it for calls that need nothing else. """
+    if fields is None:
+        return ServerProxy(nzbget_xml_rpc_url(), allow_none=True, use_builtin_types=True)
+
+    transport = FieldFilterTransport(fields, use_builtin_types=True)
+    return ServerProxy(nzbget_xml_rpc_url(), transport=transport, allow_none=True)
+
+def nzbget_xml_rpc():
+    """ Returns the shared XML-RPC connection to NZBGet, connecting on first use. """
+    global _nzbget
+
+    if _nzbget is None:
+        _nzbget = nzbget_connect_xml_rpc()
+
+    return _nzbget
+
+
+def scheduler_wakeup_fifo_path():
+    """ Returns the path of the FIFO the queue script writes to wake the scheduler early. """
+    temp_dir = os.environ.get('NZBOP_TEMPDIR') or tempfile.gettempdir()
+    return os.path.join(temp_dir, 'CappedDownloadQueue.fifo')
+
+def scheduler_wakeup_file_path():
+    """ Returns the path of the file that is touched and polled instead when the wakeup FIFO can't be used. """
+    temp_dir = os.environ.get('NZBOP_TEMPDIR') or tempfile.gettempdir()
+    return os.path.join(temp_dir, 'CappedDownloadQueue.wakeup')
+
+def scheduler_open_wakeup_fifo(fifo_path):
+    """ Creates (if needed) and opens the wakeup FIFO for the scheduler to wait on.
+    Returns the file descriptor, or None if FIFOs are not supported or it can't be opened. """
+    if not hasattr(os, 'mkfifo'):
+        return None
+
+    try:
+        if os.path.lexists(fifo_path) and not stat.S_ISFIFO(os.lstat(fifo_path).st_mode):
+            os.remove(fifo_path)
+
+        if not os.path.lexists(fifo_path):
+            os.mkfifo(fifo_path, 0o600)
+
+        # Opened read/write so there is always a writer, otherwise select() reports EOF as soon
+        # as the first queue script closes its end
+        return os.open(fifo_path, os.O_RDWR | os.O_NONBLOCK)
+    except OSError as e:
+        print(f'[WARNING] Unable to open wakeup FIFO {fifo_path}, polling {scheduler_wakeup_file_path()} instead: {e}')
+        return None
+
+def scheduler_wakeup_file_mtime(wakeup_path):
+    """ Returns the modification time of the wakeup file, or None if it does not exist. """
+    try:
+        return os.path.getmtime(wakeup_path)
+    except OSError:
+        return None
+
+def scheduler_sleep(sleep_secs, poll_secs, wakeup_fd, wakeup_path, wakeup_mtime):
+    """ Sleeps for up to sleep_secs, returning True if the queue script woke the scheduler early.
+    Waits on the wakeup FIFO if it's open, otherwise checks the wakeup file against wakeup_mtime every poll_secs. """
+    if wakeup_fd is not None:
+        readable, _, _ = select.select([wakeup_fd], [], [], sleep_secs)
+
+        if not readable:
+            return False
+
+        # Drain every pending wakeup, they are all handled by the next listgroups
+        try:
+            while os.read(wakeup_fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+        return True
+
+    slept_secs = 0
+
+    while slept_secs < sleep_secs:
+        time.sleep(min(poll_secs, sleep_secs - slept_secs))
+        slept_secs += poll_secs
+
+        if scheduler_wakeup_file_mtime(wakeup_path) != wakeup_mtime:
+            return True
+
+    return False
+
+def scheduler_write_wakeup_fifo(fifo_path):
+    """ Writes a wakeup to the FIFO. Returns False if the FIFO can't be written, e.g. FIFOs aren't supported,
+    the scheduler couldn't create it or isn't reading it. """
+    if not hasattr(os, 'mkfifo'):
+        return False
+
+    try:
+        wakeup_fd = os.open(fifo_path, os.O_WRONLY | os.O_NONBLOCK)
+    except OSError:
+        return False
+
+    try:
+        os.write(wakeup_fd, b'\n')
+    except BlockingIOError:
+        # The FIFO is full of wakeups the scheduler hasn't read yet, so it's already going to wake
+        pass
+    finally:
+        os.close(wakeup_fd)
+
+    return True
+
+def scheduler_wakeup():
+    """ Wakes the scheduler through the wakeup FIFO, or by touching the wakeup file that the scheduler polls
+    when it couldn't open the FIFO. """
+    if scheduler_write_wakeup_fifo(scheduler_wakeup_fifo_path()):
+        return
+
+    wakeup_path = scheduler_wakeup_file_path()
+
+    with open(wakeup_path, 'a'):
+        os.utime(wakeup_path, None)
 
-    return ServerProxy(rpc_url)
 
+def scheduler_import_optional_modules():
+    """ Imports NumPy, and Numba to compile nzbget_sizes_select_to_resume(), if they're installed.
+    Only the scheduler uses them, so the queue script never pays for the imports. """
+    global numpy, numba, nzbget_sizes_select_to_resume
+
+    if numpy is not None:
+        return
+
+    try:
+        import numpy
+    except ImportError:
+        # Optional - only used to speed up very large queues
+        return
+
+    try:
+        import numba
+    except ImportError:
+        # Optional - compiles the resume selection for very large queues
+        return
+
+    try:
+        nzbget_sizes_select_to_resume = numba.njit(cache=True)(nzbget_sizes_select_to_resume)
+    except (RuntimeError, OSError) as e:
+        # Numba refuses to cache when neither __pycache__ nor its user cache dir is writable
+        print(f'[WARNING] Unable to compile with Numba, using NumPy instead: {e}')
+        numba = None
+
+
+def nzbget_groups_from_rpc(rpc_groups):
+    """ Converts the dicts returned by listgroups into Group tuples. """
+    return [Group(group['NZBID'], group['MaxPriority'], group['FileSizeMB'], group['RemainingSizeMB'], group['Status'])
+            for group in rpc_groups]
 
 def nzbget_group_is_active(group):
     """ Returns True if the group is considered 'active' i.e. downloading, post-processing, running a script, etc, but NOT 'PAUSED'. """
-    return group['Status'] != 'PAUSED'
+    return group.status != 'PAUSED'
 
 def nzbget_groups_total_active_size_mb(groups, ignore_group_id=None):
     """ Returns the total size (in MB) of the groups that are considered active. """
-    total_size_mb = 0
+    return sum(group.size_mb for group in groups
+               if group.nzbid != ignore_group_id and nzbget_group_is_active(group))
+
+def nzbget_groups_partition_paused(groups):
+    """ Splits the groups into (paused_groups, active_groups) in a single pass. """
+    paused_groups = []
+    active_groups = []
 
     for group in groups:
-        group_id = group['NZBID']
+        if nzbget_group_is_active(group):
+            active_groups.append(group)
+        else:
+            paused_groups.append(group)
+
+    return paused_groups, active_groups
+
+def nzbget_groups_update_paused_since(paused_since, paused_groups, now):
+    """ Records when each paused group was first seen paused in paused_since ({nzbid: timestamp}),
+    forgetting groups that are no longer paused. """
+    paused_group_ids = set()
+
+    for group in paused_groups:
+        group_id = group.nzbid
+        paused_group_ids.add(group_id)
+        paused_since.setdefault(group_id, now)
+
+    for group_id in set(paused_since) - paused_group_ids:
+        del paused_since[group_id]
+
+def nzbget_group_aged_priority(group, paused_since, aging_rate):
+    """ Returns the group's priority, raised by aging_rate for every hour it has been paused.
+    Hours are counted from a fixed point rather than from now, so the value stays the same between ticks
+    while still ordering groups the same way. """
+    return group.priority - aging_rate * paused_since[group.nzbid] / 3600
+
+def nzbget_priority_index_update(priority_index, index_entries, paused_groups, priorities=None):
+    """ Updates priority_index, a sorted list of (-priority, rank, nzbid) entries for the paused groups that is kept
+    between ticks. index_entries maps each nzbid to its entry. The rank is the group's place in the queue, so groups
+    sharing a priority keep their queue order.
+
+    Only groups that were added, removed or changed priority are moved. If the queue was reordered, or new groups
+    were added anywhere but the end of the queue, the index is rebuilt.
+    priorities can be given (in the same order as paused_groups) to use instead of each group's priority. """
+    if priorities is None:
+        priorities = [group.priority for group in paused_groups]
+
+    paused_group_ids = set()
+    changed_entries = []
+    new_groups = []
+    last_rank = -1
+    reordered = not index_entries
+
+    for group, priority in zip(paused_groups, priorities):
+        group_id = group.nzbid
+        paused_group_ids.add(group_id)
+        entry = index_entries.get(group_id)
+
+        if entry is None:
+            new_groups.append((group_id, priority))
+        elif new_groups or entry[1] <= last_rank:
+            reordered = True
+            break
+        else:
+            last_rank = entry[1]
+
+            if entry[0] != -priority:
+                changed_entries.append((entry, (-priority, entry[1], group_id)))
+
+    if reordered:
+        index_entries.clear()
+
+        for rank, (group, priority) in enumerate(zip(paused_groups, priorities)):
+            index_entries[group.nzbid] = (-priority, rank, group.nzbid)
+
+        priority_index[:] = sorted(index_entries.values())
+        return
+
+    for group_id in set(index_entries) - paused_group_ids:
+        entry = index_entries.pop(group_id)
+        del priority_index[bisect.bisect_left(priority_index, entry)]
+
+    for old_entry, entry in changed_entries:
+        del priority_index[bisect.bisect_left(priority_index, old_entry)]
+        bisect.insort(priority_index, entry)
+        index_entries[entry[2]] = entry
+
+    for rank, (group_id, priority) in enumerate(new_groups, last_rank + 1):
+        entry = (-priority, rank, group_id)
+        bisect.insort(priority_index, entry)
+        index_entries[group_id] = entry
+
+def nzbget_groups_iter_nzbs_by_priority(priority_index, paused_groups):
+    """ Generator func that yields the paused nzbs (groups) in the order of the priority index. """
+    paused_groups_by_id = {group.nzbid: group for group in paused_groups}
+
+    for _, _, group_id in priority_index:
+        yield paused_groups_by_id[group_id]
+
+def nzbget_groups_select_to_resume(priority_index, paused_groups, remaining_size_mb):
+    """ Picks paused groups in order of priority while they fit in remaining_size_mb.
+    Returns (group_ids_to_resume, remaining_size_mb). """
+    groups_by_priority = nzbget_groups_iter_nzbs_by_priority(priority_index, paused_groups)
+
+    if numpy is not None and len(paused_groups) >= VECTORIZE_MIN_GROUPS:
+        return nzbget_groups_select_to_resume_vectorized(list(groups_by_priority), remaining_size_mb)
+
+    group_ids_to_resume = []
+
+    # Once the remaining space is smaller than every paused group nothing else can be resumed
+    paused_sizes_mb = [group.remaining_size_mb for group in paused_groups]
+    min_paused_size_mb = min(paused_sizes_mb) if paused_sizes_mb else remaining_size_mb + 1
+
+    for group in groups_by_priority:
+        if remaining_size_mb < min_paused_size_mb:
+            break
+
+        group_size = group.remaining_size_mb
 
-        if group_id != ignore_group_id and nzbget_group_is_active(group):
-            total_size_mb += group['FileSizeMB']
+        if group_size <= remaining_size_mb:
+            group_ids_to_resume.append(group.nzbid)
+            remaining_size_mb -= group_size
 
-    return total_size_mb
+    return group_ids_to_resume, remaining_size_mb
 
-def nzbget_groups_iter_nzbs_by_priority(groups):
-    """ Generator func that yields nzbs (groups) from the list of groups in the order of priority. """
-    yielded_groups = 0
+def nzbget_sizes_select_to_resume(sizes_mb, remaining_size_mb):
+    """ Marks each size in sizes_mb (a NumPy array in order of priority) that still fits in remaining_size_mb.
+    Returns (selected_mask, remaining_size_mb). Only used when compiled with Numba. """
+    selected = numpy.zeros(sizes_mb.size, dtype=numpy.bool_)
 
-    # the current priority being yielded
-    # On each iteration, this will be set to the next lowest priority until all
-    # groups are exhausted
-    current_priority = 999999
+    for i in range(sizes_mb.size):
+        if sizes_mb[i] <= remaining_size_mb:
+            selected[i] = True
+            remaining_size_mb -= sizes_mb[i]
 
-    while len(groups) != yielded_groups:
-        # discover current priority
-        next_priority = -999999
-        for group in groups:
-            group_priority = group['MaxPriority']
-            
-            if group_priority > next_priority and group_priority < current_priority:
-                next_priority = group_priority
+    return selected, remaining_size_mb
 
-        # print('[nzbget_group_iter_nzbs_by_priority] Moving from priority %d to %d' % (current_priority, next_priority))
-        current_priority = next_priority
+def nzbget_groups_select_to_resume_vectorized(groups_by_priority, remaining_size_mb):
+    """ NumPy version of nzbget_groups_select_to_resume() for large queues. groups_by_priority is a list of the
+    paused groups, already in order of priority. """
+    group_count = len(groups_by_priority)
+    sizes_mb = numpy.fromiter((group.remaining_size_mb for group in groups_by_priority), dtype=numpy.int64, count=group_count)
 
-        # now yield all groups that match the priority
-        # priority is matched exactly so no need for fuzzy matching
-        for group in groups:
-            if group['MaxPriority'] == current_priority:
-                yielded_groups += 1
-                yield group
+    if numba is not None:
+        selected, remaining_size_mb = nzbget_sizes_select_to_resume(sizes_mb, remaining_size_mb)
+        return [groups_by_priority[i].nzbid for i in numpy.flatnonzero(selected)], int(remaining_size_mb)
+
+    selected = numpy.zeros(group_count, dtype=bool)
+
+    # Each round admits the longest run of candidates that fits. The group that ends the run is too big
+    # for what's left, as is any group already too big, so the next round only considers smaller groups.
+    candidates = numpy.flatnonzero(sizes_mb <= remaining_size_mb)
+
+    while candidates.size:
+        admitted = candidates[numpy.cumsum(sizes_mb[candidates]) <= remaining_size_mb]
+        selected[admitted] = True
+        remaining_size_mb -= int(sizes_mb[admitted].sum())
+
+        candidates = candidates[admitted.size:]
+        candidates = candidates[sizes_mb[candidates] <= remaining_size_mb]
+
+    return [groups_by_priority[i].nzbid for i in numpy.flatnonzero(selected)], remaining_size_mb
 
 
 def main_schedulerscript():
-    # Disable print output buffering - https://stackoverflow.com/a/181654
-    try:
-        # Python 3, open as binary, then wrap in a TextIOWrapper with write-through.
-        sys.stdout = io.TextIOWrapper(open(sys.stdout.fileno(), 'wb', 0), write_through=True)
-    except TypeError:
-        # Python 2
-        sys.stdout = os.fdopen(sys.stdout.fileno(), 'w', 0)
+    # Flush every printed line so NZBGet sees log output while the scheduler keeps running
+    sys.stdout.reconfigure(line_buffering=True)
+
+    scheduler_import_optional_modules()
 
     print('[INFO] Starting scheduler script - will continue to run')
 
     storage_size_mb = int(os.environ.get('NZBPO_STORAGESIZEGB', 0)) * 1024
     sleep_period_secs = int(os.environ.get('NZBPO_SCHEDULERREFRESHINTERVAL', 0))
+    max_sleep_period_secs = int(os.environ.get('NZBPO_SCHEDULERMAXREFRESHINTERVAL', 0))
+    aging_rate = float(os.environ.get('NZBPO_PRIORITYAGINGRATE', 0))
 
     if not storage_size_mb:
         print('[ERROR] StorageSizeGB is missing from the script configuration.')
@@ -157,49 +509,94 @@ def main_schedulerscript():
         print('[ERROR] SchedulerRefreshInterval is missing from the script configuration.')
         return PP_ERROR
 
-    nzbget = nzbget_connect_xml_rpc()
+    # Older configs will not have the max interval, so don't back off at all
+    max_sleep_period_secs = max(max_sleep_period_secs, sleep_period_secs)
+
+    nzbget = nzbget_xml_rpc()
+    # Separate connection for listgroups so only the fields the scheduler reads are unmarshalled
+    nzbget_listgroups = nzbget_connect_xml_rpc(LISTGROUPS_FIELDS)
+    wakeup_fd = scheduler_open_wakeup_fifo(scheduler_wakeup_fifo_path())
+    wakeup_path = scheduler_wakeup_file_path()
+
+    # When each paused group was first seen paused, used to age its priority
+    paused_since = {}
+
+    # Paused groups in priority order, kept between ticks and only updated as groups change
+    priority_index = []
+    index_entries = {}
+
+    # Number of consecutive ticks that resumed nothing, used to back off the refresh interval
+    idle_streak = 0
 
     while True:
-        groups = nzbget.listgroups()
+        wakeup_mtime = scheduler_wakeup_file_mtime(wakeup_path)
+        groups = nzbget_groups_from_rpc(nzbget_listgroups.listgroups())
 
-        # Free space check - abort if there is no free space
-        groups_total_size_mb = nzbget_groups_total_active_size_mb(groups)
+        # Only paused groups can be resumed, so the rest are only needed for the active size
+        paused_groups, active_groups = nzbget_groups_partition_paused(groups)
 
-        if groups_total_size_mb < storage_size_mb:
-            # There is free space - pull nzbs in priority order to fill up the available space
-            groups_to_resume = []
-            remaining_size_mb = storage_size_mb - groups_total_size_mb
+        groups_total_size_mb = nzbget_groups_total_active_size_mb(active_groups)
+
+        priorities = None
+
+        if aging_rate:
+            now = time.time()
+            nzbget_groups_update_paused_since(paused_since, paused_groups, now)
+            priorities = [nzbget_group_aged_priority(group, paused_since, aging_rate) for group in paused_groups]
 
-            for group in nzbget_groups_iter_nzbs_by_priority(groups):
-                group_id = group['NZBID']
-                group_size = group['RemainingSizeMB']
-                group_status = group['Status']
+        nzbget_priority_index_update(priority_index, index_entries, paused_groups, priorities)
 
-                if group_status == 'PAUSED' and group_size <= remaining_size_mb:
-                    groups_to_resume.append(group_id)
-                    remaining_size_mb -= group_size
+        groups_to_resume = []
+
+        # Free space check - abort if there is no free space
+        if groups_total_size_mb < storage_size_mb:
+            # There is free space - pull nzbs in priority order to fill up the available space
+            groups_to_resume, remaining_size_mb = nzbget_groups_select_to_resume(
+                    priority_index, paused_groups, storage_size_mb - groups_total_size_mb)
 
             if groups_to_resume:
                 new_groups_total_size_mb = storage_size_mb - remaining_size_mb
-                print('[INFO] groups_to_resume=%s old_group_size_mb=%d new_group_size_mb=%d' % 
-                        (str(groups_to_resume), groups_total_size_mb, new_groups_total_size_mb))
+                print(f'[INFO] groups_to_resume={groups_to_resume} old_group_size_mb={groups_total_size_mb} '
+                      f'new_group_size_mb={new_groups_total_size_mb}')
+                # Every resume for this tick goes out in one editqueue call. It depends on the listgroups
+                # result above, so the two calls can't be merged into a single multicall.
                 nzbget.editqueue('GroupResume', '', groups_to_resume)
 
-        time.sleep(sleep_period_secs)
+        # Nothing changes until an NZB is added or finishes, so check less often while idle
+        if groups_to_resume:
+            idle_streak = 0
+        elif sleep_period_secs * 2 ** idle_streak < max_sleep_period_secs:
+            idle_streak += 1
+
+        sleep_secs = min(sleep_period_secs * 2 ** idle_streak, max_sleep_period_secs)
+
+        if scheduler_sleep(sleep_secs, sleep_period_secs, wakeup_fd, wakeup_path, wakeup_mtime):
+            idle_streak = 0
 
     return PP_SUCCESS
 
 
 def main_queuescript():
-    if os.environ.get('NZBNA_EVENT') not in ['NZB_ADDED']:
+    nzbna_event = os.environ.get('NZBNA_EVENT')
+
+    if nzbna_event not in QUEUE_EVENTS:
         return 0
 
-    # Pause the NZB so that it can be unpaused in priority order after the space check
-    nzbna_nzbid = int(os.environ.get('NZBNA_NZBID'))
-    print('[INFO] Pausing newly-added NZB %d to allow scheduler to resume it when space is available' % nzbna_nzbid)
+    if nzbna_event == 'NZB_ADDED':
+        # Pause the NZB so that it can be unpaused in priority order after the space check
+        nzbna_nzbid = int(os.environ.get('NZBNA_NZBID'))
+        print(f'[INFO] Pausing newly-added NZB {nzbna_nzbid} to allow scheduler to resume it when space is available')
+
+        # NZBGet runs the queue script in a new process for each event, so there are no other pauses to
+        # batch into this call. Deferring it would let the NZB start downloading before it's paused.
+        nzbget = nzbget_xml_rpc()
+        nzbget.editqueue('GroupPause', '', [nzbna_nzbid])
 
-    nzbget = nzbget_connect_xml_rpc()
-    nzbget.editqueue('GroupPause', '', [nzbna_nzbid])
+    # Wake the scheduler so it can resume NZBs now rather than at its next refresh
+    try:
+        scheduler_wakeup()
+    except OSError as e:
+        print(f'[WARNING] Unable to wake the scheduler: {e}')
  
     return PP_SUCCESS
     